@@ -1,8 +1,16 @@
 # main.py — Telegram ➜ Discord forwarder (DPI-hardened, Python 3.8/3.9)
-import os, sys, asyncio, time, tempfile, logging
-from typing import Optional
-import requests
-from telethon import TelegramClient, events
+import os, io, sys, asyncio, time, random, atexit, queue, logging
+from logging.handlers import QueueHandler, QueueListener
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple, Union
+import aiohttp
+try:
+    import orjson  # optional: faster JSON encoding for webhook payloads
+    _dumps = orjson.dumps
+except ImportError:
+    import json
+    def _dumps(obj) -> bytes: return json.dumps(obj).encode()
+from telethon import TelegramClient, events, utils
 from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument
 from telethon.network.connection import (
     ConnectionTcpAbridged,
@@ -21,6 +29,12 @@ SESSION_NAME = os.environ.get("TG_SESSION", "forwarder")
 PREFIX = os.environ.get("DISCORD_PREFIX", "")
 DISABLE_PREVIEW = os.environ.get("DISABLE_PREVIEW", "").lower() in {"1","true","yes"}
 MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(8*1024*1024)))
+DISCORD_RATE        = int(os.environ.get("DISCORD_RATE", "5"))          # posts per window (webhook bucket)
+DISCORD_RATE_WINDOW = float(os.environ.get("DISCORD_RATE_WINDOW", "2"))  # seconds
+MAX_CONCURRENT_UPLOADS = int(os.environ.get("MAX_CONCURRENT_UPLOADS", "4"))
+ALBUM_WINDOW        = float(os.environ.get("ALBUM_WINDOW", "0.8"))       # seconds to collect an album; 0 = off
+MAX_CONCURRENT_ALBUMS = int(os.environ.get("MAX_CONCURRENT_ALBUMS", "2"))  # albums buffered in memory at once
+BATCH_WINDOW        = float(os.environ.get("BATCH_WINDOW", "1.0"))       # seconds to coalesce text; 0 = off
 
 FORCE_HEADLESS  = os.environ.get("FORCE_HEADLESS", "").lower() in {"1","true","yes"}
 START_TIMEOUT   = int(os.environ.get("START_TIMEOUT", "120"))
@@ -56,12 +70,19 @@ MTPROXY_PORT = os.environ.get("MTPROXY_PORT")
 MTPROXY_SECRET = os.environ.get("MTPROXY_SECRET")
 
 # ===== Logging =====
+def _queued(handler: logging.Handler) -> logging.Handler:
+    # The event loop only enqueues records; the write()/flush() happens on a listener thread.
+    q = queue.Queue(-1)
+    listener = QueueListener(q, handler)
+    listener.start(); atexit.register(listener.stop)
+    return QueueHandler(q)
+
 logger = logging.getLogger("tg_to_discord")
 if not logger.handlers:
     logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
     h = logging.FileHandler(LOG_FILE) if LOG_FILE else logging.StreamHandler()
     h.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
-    logger.addHandler(h)
+    logger.addHandler(_queued(h))
 
 if TELETHON_LOG:
     tlog = logging.getLogger("telethon")
@@ -69,91 +90,279 @@ if TELETHON_LOG:
     if not tlog.handlers:
         th = logging.StreamHandler()
         th.setFormatter(logging.Formatter("%(asctime)s [telethon:%(levelname)s] %(message)s"))
-        tlog.addHandler(th)
+        tlog.addHandler(_queued(th))
 
 # ===== Helpers =====
-def _to_target(s: str):
-    s = s.strip().strip('"').strip("'")
-    if not s: return None
-    if s.startswith("@"): return s
-    try: return int(s)
-    except ValueError: return s
+_QSTRIP = str.maketrans("", "", "\"' \t\r\n")  # quotes and whitespace never belong in a target
+
+def _to_target(p: str):
+    if p.startswith("@"): return p
+    try: return int(p)
+    except ValueError: return p
 
 def parse_targets(single: str, multi: str):
-    out = []
-    if multi:
-        for p in multi.split(","):
-            t = _to_target(p)
-            if t is not None: out.append(t)
-    elif single:
-        t = _to_target(single)
-        if t is not None: out.append(t)
-    return out
+    raw = multi.split(",") if multi else [single] if single else []
+    out = [_to_target(p) for p in (x.translate(_QSTRIP) for x in raw) if p and p != "@"]
+    return list(dict.fromkeys(out))  # drop repeats, keep order
 
 TARGETS = parse_targets(_single, _multi)
 if not TARGETS:
     raise SystemExit("No channels provided. Set TG_CHANNELS='@chan1,-100123...' or TG_CHANNEL='@one'.")
-
-def post_text_to_discord(text: str):
-    payload = {"content": text[:2000] or "."}
-    for attempt in range(5):
+_NAME_TARGETS = frozenset(t for t in TARGETS if isinstance(t, str) and t.startswith("@"))
+
+# ===== Discord =====
+class AsyncRateLimiter:
+    """Client-side webhook bucket: wait locally instead of eating a 429 round-trip."""
+    def __init__(self, rate: int, per: float):
+        self.rate, self.per = rate, per
+        self._sent = deque(maxlen=rate)
+        self._lock = asyncio.Lock()
+        self._blocked_until = 0.0
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self._blocked_until > now:
+                await asyncio.sleep(self._blocked_until - now); now = time.monotonic()
+            if len(self._sent) == self.rate:
+                delta = self._sent[0] + self.per - now
+                if delta > 0:
+                    await asyncio.sleep(delta); now = time.monotonic()
+            self._sent.append(now)
+
+    def update(self, headers):
+        # Discord reports when the bucket is drained; hold the next send until it resets.
+        if headers.get("X-RateLimit-Remaining") == "0":
+            try: self.block(float(headers.get("X-RateLimit-Reset-After", "0")))
+            except ValueError: pass
+
+    def block(self, seconds: float):
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+# Created in main(): aiohttp sessions and asyncio locks must be bound to the running loop.
+SESSION: Optional[aiohttp.ClientSession] = None
+LIMITER: Optional[AsyncRateLimiter] = None
+DISCORD_QUEUE: Optional[asyncio.Queue] = None
+UPLOAD_SEM: Optional[asyncio.Semaphore] = None
+ALBUM_SEM: Optional[asyncio.Semaphore] = None
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+TEXT_TIMEOUT = aiohttp.ClientTimeout(total=10)
+FILE_TIMEOUT = aiohttp.ClientTimeout(total=30)
+
+DISCORD_RETRIES = 6
+_rng = random.Random()
+
+def _next_delay(attempt: int, cap: float = 30.0, base: float = 0.5) -> float:
+    # Full-jitter exponential backoff: concurrent senders don't wake up in lockstep.
+    return _rng.uniform(0, min(cap, base * (2 ** attempt)))
+
+async def _retry_after(r) -> float:
+    # Seconds to wait after a 429: the Retry-After header, else retry_after from the JSON body.
+    try: return float(r.headers["Retry-After"])
+    except (KeyError, ValueError): pass
+    try: return float((await r.json(content_type=None)).get("retry_after", 0))
+    except Exception: return 0.0
+
+async def _post_webhook(kind: str, build_kwargs, timeout: aiohttp.ClientTimeout) -> bool:
+    for attempt in range(DISCORD_RETRIES):
+        last = attempt + 1 == DISCORD_RETRIES  # no backoff after the final try: it would stall the writer
+        await LIMITER.acquire()
         try:
-            r = requests.post(DISCORD_WEBHOOK, json=payload, timeout=10)
-            if r.ok or r.status_code == 204: return
-            if r.status_code == 429:
-                wait = float(r.headers.get("Retry-After", "1")); time.sleep(wait); continue
-        except requests.RequestException as e:
-            logger.warning("Discord post exception: %s", e)
-        time.sleep(1 + attempt)
-    logger.error("Discord text post failed after retries.")
-
-def post_file_to_discord(path: str, content: Optional[str] = None):
-    data = {};
-    if content: data["content"] = content[:2000]
-    for attempt in range(5):
+            async with SESSION.post(DISCORD_WEBHOOK, timeout=timeout, **build_kwargs()) as r:
+                LIMITER.update(r.headers)
+                if r.ok: return True
+                status = r.status
+                if status == 429: wait = await _retry_after(r)
+            if status == 429:
+                # Pause every sender, not just this one, until Discord's bucket reopens.
+                LIMITER.block(wait)
+                if not last: await asyncio.sleep(max(wait, _next_delay(attempt)))
+                continue
+            if status < 500:
+                logger.error("Discord %s post rejected: HTTP %s", kind, status)
+                return False
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("Discord %s post exception: %s", kind, e)
+        if not last: await asyncio.sleep(_next_delay(attempt))
+    logger.error("Discord %s post failed after retries.", kind)
+    return False
+
+async def post_text_to_discord(text: str) -> bool:
+    body = _dumps({"content": text[:2000] or "."})
+    return await _post_webhook("text", lambda: {"data": body, "headers": JSON_HEADERS}, TEXT_TIMEOUT)
+
+async def post_files_to_discord(files: List[Tuple[str, Union[bytes, memoryview], str]],
+                                content: Optional[str] = None) -> bool:
+    """Upload up to 10 (filename, data, content_type) attachments in one webhook call."""
+    payload_json = _dumps({"content": content[:2000]} if content else {}).decode()
+    def build_form():
+        # FormData can only be sent once, so every attempt gets a fresh one.
+        form = aiohttp.FormData()
+        form.add_field("payload_json", payload_json, content_type="application/json")
+        for i, (filename, data, content_type) in enumerate(files):
+            form.add_field(f"files[{i}]", data, filename=filename, content_type=content_type)
+        return {"data": form}
+    return await _post_webhook("file", build_form, FILE_TIMEOUT)
+
+async def post_file_to_discord(filename: str, data: Union[bytes, memoryview], content: Optional[str] = None,
+                               content_type: str = "application/octet-stream") -> bool:
+    return await post_files_to_discord([(filename, data, content_type)], content)
+
+# ===== Single Discord writer =====
+# Every forward goes through one FIFO consumer, so bursts across chats are paced by
+# LIMITER instead of racing each other into 429s. Producers wait for their own result.
+# Each job carries `lost`: (what, channel title, link) for every message in it, logged
+# by the writer if the post fails or is still unsent at shutdown.
+SHUTDOWN_DRAIN = 5.0  # seconds queued posts get to go out on shutdown
+
+def log_lost(what: str, title: str, link: Optional[str]):
+    # The poster already logged why; this says which message never made it to Discord.
+    logger.error("LOST %s | channel='%s' | link='%s'", what, title, link or "-")
+
+def enqueue_post(kind: str, *args, lost=(), **kwargs) -> asyncio.Future:
+    done = asyncio.get_running_loop().create_future()
+    DISCORD_QUEUE.put_nowait({"kind": kind, "args": args, "kwargs": kwargs, "lost": lost, "done": done})
+    return done
+
+async def submit_post(kind: str, *args, **kwargs) -> bool:
+    flush_text()  # text buffered before this post must not reach Discord after it
+    return await enqueue_post(kind, *args, **kwargs)
+
+async def discord_worker():
+    senders = {"text": post_text_to_discord, "file": post_file_to_discord, "files": post_files_to_discord}
+    while True:
+        job = await DISCORD_QUEUE.get()
+        send = senders[job["kind"]]
         try:
-            with open(path, "rb") as f:
-                r = requests.post(DISCORD_WEBHOOK, data=data, files={"file": (os.path.basename(path), f)}, timeout=30)
-            if r.ok or r.status_code == 204: return
-            if r.status_code == 429:
-                wait = float(r.headers.get("Retry-After", "1")); time.sleep(wait); continue
-        except requests.RequestException as e:
-            logger.warning("Discord file post exception: %s", e)
-        time.sleep(1 + attempt)
-    logger.error("Discord file post failed after retries.")
+            ok = await send(*job["args"], **job["kwargs"])
+        except asyncio.CancelledError:
+            for x in job["lost"]: log_lost(*x)
+            raise
+        except Exception:
+            logger.exception("Discord %s job failed", job["kind"]); ok = False
+        if not ok:
+            for x in job["lost"]: log_lost(*x)
+        if not job["done"].done(): job["done"].set_result(ok)
+        DISCORD_QUEUE.task_done()
+
+async def drain_discord_queue(sender: asyncio.Task):
+    """On shutdown: flush buffered text, give queued posts SHUTDOWN_DRAIN seconds, log the rest as lost."""
+    flush_text()
+    try:
+        await asyncio.wait_for(DISCORD_QUEUE.join(), SHUTDOWN_DRAIN)
+    except asyncio.TimeoutError:
+        logger.warning("Discord queue not drained within %ss", SHUTDOWN_DRAIN)
+    sender.cancel()
+    await asyncio.gather(sender, return_exceptions=True)  # logs the in-flight job if it was cut off
+    while not DISCORD_QUEUE.empty():
+        for x in DISCORD_QUEUE.get_nowait()["lost"]: log_lost(*x)
+
+# ===== Text batching =====
+# Text posts wait up to BATCH_WINDOW in _text_buf and go out in as few webhook calls as fit
+# in 2000 chars. Any other post flushes the buffer into the writer queue first, so a text
+# is never overtaken by an image that followed it (at the cost of a smaller batch).
+BATCH_SEP = "\n---\n"
+_text_buf: List[Tuple[str, str, Optional[str]]] = []  # (message, channel title, link)
+_text_timer: Optional[asyncio.Task] = None
+
+def flush_text() -> List[asyncio.Future]:
+    """Hand buffered text to the Discord writer now, in order; no await, so nothing slips in between."""
+    global _text_timer
+    if _text_timer is not None and _text_timer is not asyncio.current_task(): _text_timer.cancel()
+    _text_timer = None
+    batches: List[Tuple[str, list]] = []
+    for text, title, link in _text_buf:
+        if batches and len(batches[-1][0]) + len(BATCH_SEP) + len(text) <= 2000:
+            batches[-1] = (batches[-1][0] + BATCH_SEP + text, batches[-1][1] + [("TEXT", title, link)])
+        else:
+            batches.append((text, [("TEXT", title, link)]))
+    _text_buf.clear()
+    return [enqueue_post("text", b, lost=lost) for b, lost in batches]
+
+async def _flush_text_later():
+    await asyncio.sleep(BATCH_WINDOW)
+    flush_text()
+
+async def queue_text_to_discord(text: str, title: str, link: Optional[str]):
+    global _text_timer
+    if BATCH_WINDOW <= 0:
+        await submit_post("text", text, lost=[("TEXT", title, link)]); return
+    _text_buf.append((text, title, link))
+    if _text_timer is None: _text_timer = asyncio.create_task(_flush_text_later())
+
+_LINK_FMT = "<https://t.me/{}/{}>" if DISABLE_PREVIEW else "https://t.me/{}/{}"
 
 def build_link(username: Optional[str], message_id: Optional[int]) -> str:
-    if username and message_id:
-        raw = f"https://t.me/{username}/{message_id}"
-        return f"<{raw}>" if DISABLE_PREVIEW else raw
-    return ""
+    return _LINK_FMT.format(username, message_id) if username and message_id else ""
+
+def build_header(title: str) -> str:
+    return f"{PREFIX}[{title}]"
+
+def build_message(head: str, text: str, link: str) -> str:
+    if text and link: return f"{head}\n\n{text}\n\n{link}"
+    if text: return f"{head}\n\n{text}"
+    if link: return f"{head}\n\n{link}"
+    return head
 
-def build_message(title: str, text: str, link: str) -> str:
-    parts = [f"{PREFIX}[{title}]"]
-    if text: parts += ["", text]
-    if link: parts += ["", link]
-    return "\n".join(parts)
+MIME_EXT = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp", "image/gif": ".gif",
+            "image/bmp": ".bmp"}
 
 def is_image_document(msg) -> bool:
-    try:
-        doc = msg.document
-        if not doc: return False
-        mime = getattr(doc, "mime_type", "") or ""
-        return mime.startswith("image/")
-    except Exception:
-        return False
+    doc = msg.document  # Telethon: None unless the media is a document
+    return doc is not None and (doc.mime_type or "").startswith("image/")
+
+def expected_media_size(msg) -> Optional[int]:
+    """Byte size Telegram reports for the media before downloading (None if unknown)."""
+    if isinstance(msg.media, MessageMediaDocument):
+        return getattr(msg.document, "size", None)
+    best = None
+    for ps in getattr(msg.photo, "sizes", None) or []:
+        size = getattr(ps, "size", None)
+        if size is None:
+            progressive = getattr(ps, "sizes", None)  # PhotoSizeProgressive
+            size = progressive[-1] if progressive else None
+        if size is not None and (best is None or size > best): best = size
+    return best
+
+def _display_name_for_target(target, ent) -> str:
+    # Built from the entity _resolve_targets already fetched; no extra lookups per target.
+    if target in _NAME_TARGETS or isinstance(ent, Exception): return str(target)
+    uname = getattr(ent, "username", None)
+    if uname: return f"@{uname}"
+    title = getattr(ent, "title", None)
+    if title: return f"[{title}]"
+    return str(getattr(ent, "id", target))
+
+def _remember_entity(ent) -> int:
+    """Cache a resolved target's title/username in _CHAT_CACHE and return its marked peer id."""
+    peer_id = utils.get_peer_id(ent)
+    username = getattr(ent, "username", None)
+    title = getattr(ent, "title", None) or username or "Telegram"
+    _CHAT_CACHE[peer_id] = (title, username, build_header(title), time.monotonic())
+    return peer_id
+
+async def _resolve_targets(client: TelegramClient, targets) -> list:
+    """Entities for targets, in order; an Exception in place of any that failed."""
+    # get_entity(list) only batches ids into GetChannels/GetUsers; strings are resolved one by
+    # one inside it. So batch the numeric ids and resolve @names/links in parallel.
+    ids = [t for t in targets if isinstance(t, int)]
+    names = [t for t in targets if not isinstance(t, int)]
+
+    async def resolve_ids():
+        if not ids: return []
+        try:
+            return await client.get_entity(ids)
+        except Exception as e:
+            logger.warning("Batch resolve of ids failed (%s); resolving them individually", e)
+            return await asyncio.gather(*[client.get_entity(t) for t in ids], return_exceptions=True)
 
-async def _display_name_for_target(client: TelegramClient, target) -> str:
-    try:
-        if isinstance(target, str) and target.startswith("@"): return target
-        ent = await client.get_entity(target)
-        uname = getattr(ent, "username", None)
-        if uname: return f"@{uname}"
-        title = getattr(ent, "title", None)
-        if title: return f"[{title}]"
-        return str(getattr(ent, "id", target))
-    except Exception:
-        return str(target)
+    by_id, by_name = await asyncio.gather(
+        resolve_ids(),
+        asyncio.gather(*[client.get_entity(t) for t in names], return_exceptions=True),
+    )
+    resolved = dict(zip(ids, by_id)); resolved.update(zip(names, by_name))
+    return [resolved[t] for t in targets]
 
 def build_proxy():
     try:
@@ -179,70 +388,193 @@ PROXY = build_proxy()
 MTPROXY = build_mtproxy()
 proxy_for_client = MTPROXY if TG_CONN == "mtproxy" else PROXY
 
-# ===== Telethon client (sequential updates to avoid loop bug) =====
+# ===== Telethon client =====
+# Ordering is kept per chat by the worker queues below, so updates need not be sequential.
 client = TelegramClient(
     SESSION_NAME, API_ID, API_HASH,
     connection=CONN_CLASS,
-    sequential_updates=True,
     connection_retries=3, request_retries=3, retry_delay=2, timeout=10,
     use_ipv6=False, proxy=proxy_for_client
 )
 
 # ===== Handler =====
-@client.on(events.NewMessage(chats=TARGETS))
-async def on_new_message(event):
-    msg = event.message
-    raw_text = (msg.message or "").strip()
+# Channel title/username barely change; avoid a get_chat() round-trip per message.
+CHAT_CACHE_TTL = 3600
+# The "{PREFIX}[title]" header is built once per chat alongside them.
+_CHAT_CACHE: Dict[int, Tuple[str, Optional[str], str, float]] = {}
+
+async def chat_info(event) -> Tuple[str, Optional[str], str]:
+    hit = _CHAT_CACHE.get(event.chat_id)
+    if hit and time.monotonic() - hit[3] < CHAT_CACHE_TTL:
+        return hit[0], hit[1], hit[2]
     try:
         chat = await event.get_chat()
         title = getattr(chat, "title", None) or getattr(chat, "username", None) or "Telegram"
         username = getattr(chat, "username", None)
     except Exception:
-        title, username = "Telegram", None
-    link = build_link(username, msg.id)
-    message = build_message(title, raw_text, link)
-
+        return "Telegram", None, build_header("Telegram")
+    header = build_header(title)
+    _CHAT_CACHE[event.chat_id] = (title, username, header, time.monotonic())
+    return title, username, header
+
+async def _forward_image(msg, ext: str, mime: str, title: str, message: str, link: str):
+    size = expected_media_size(msg)
+    if size and size > MAX_UPLOAD_BYTES:
+        logger.warning("SKIP IMAGE (too large) | channel='%s'", title)
+        await submit_post("text", message + "\n(Attachment too large to upload)", lost=[("TEXT", title, link)])
+        return
+    async with UPLOAD_SEM:
+        buf = io.BytesIO()
+        await client.download_media(msg.media, file=buf)
+        if buf.getbuffer().nbytes <= MAX_UPLOAD_BYTES:
+            logger.info("IMAGE → Discord | channel='%s' | link='%s'", title, link or "-")
+            # aiohttp streams the memoryview straight from the download buffer; no second copy.
+            await submit_post("file", "image" + ext, buf.getbuffer(), content=message, content_type=mime,
+                              lost=[("IMAGE", title, link)])
+        else:
+            logger.warning("SKIP IMAGE (too large) | channel='%s'", title)
+            await submit_post("text", message + "\n(Attachment too large to upload)", lost=[("TEXT", title, link)])
+
+def image_kind(msg) -> Optional[Tuple[str, str]]:
+    """(extension, mime) for media we forward as an image, else None."""
     if isinstance(msg.media, MessageMediaPhoto):
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tf:
-            path = await client.download_media(msg.media, file=tf.name)
-        try:
-            if os.path.getsize(path) <= MAX_UPLOAD_BYTES:
-                logger.info("IMAGE → Discord | channel='%s' | link='%s'", title, link or "-")
-                post_file_to_discord(path, content=message)
-            else:
-                logger.warning("SKIP IMAGE (too large) | channel='%s'", title)
-                post_text_to_discord(message + "\n(Attachment too large to upload)")
-        finally:
-            try: os.remove(path)
-            except Exception: pass
+        return ".jpg", "image/jpeg"
+    if isinstance(msg.media, MessageMediaDocument) and is_image_document(msg):
+        mime = (getattr(msg.document, "mime_type", "") or "").lower()
+        return MIME_EXT.get(mime, ".img"), mime
+    return None
+
+# ===== Albums =====
+# Telegram delivers each album item as its own message sharing a grouped_id. The chat's
+# worker collects them (until ALBUM_WINDOW passes with nothing new) and uploads up to
+# 10 images per webhook call; doing it in the worker keeps albums in the chat's order.
+async def collect_album(q: asyncio.Queue, first):
+    """Pull the rest of first's album off the chat queue; returns (parts, next_event)."""
+    gid, parts = first.message.grouped_id, [first]
+    while True:
+        if q.empty():
+            await asyncio.sleep(ALBUM_WINDOW)
+            if q.empty(): return parts, None
+        event = q.get_nowait()
+        if event.message.grouped_id != gid: return parts, event
+        parts.append(event)
+
+async def _download_album_image(msg, n: int):
+    ext, mime = image_kind(msg)
+    size = expected_media_size(msg)
+    if size and size > MAX_UPLOAD_BYTES: return None
+    async with UPLOAD_SEM:
+        buf = io.BytesIO()
+        await client.download_media(msg.media, file=buf)
+    if buf.getbuffer().nbytes > MAX_UPLOAD_BYTES: return None
+    return f"image{n}{ext}", buf.getbuffer(), mime
+
+async def forward_album(parts: List):
+    first = parts[0]
+    title, username, header = await chat_info(first)
+    # The caption sits on one album item (usually the first); the rest carry None.
+    raw_text = next((t for t in (e.message.message for e in parts) if t and not t.isspace()), "").strip()
+    link = build_link(username, first.message.id)
+    message = build_message(header, raw_text, link)
+    images = [e.message for e in parts if image_kind(e.message)]
+    if not images:
+        if raw_text:
+            logger.info("TEXT → Discord | channel='%s' | link='%s'", title, link or "-")
+            await queue_text_to_discord(message, title, link)
         return
 
-    if isinstance(msg.media, MessageMediaDocument) and is_image_document(msg):
-        ext = ".img"
-        mime = getattr(msg.document, "mime_type", "") or ""
-        if "/" in mime:
-            maybe = "." + mime.split("/")[-1].lower()
-            if 1 <= len(maybe) <= 6: ext = maybe
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tf:
-            path = await client.download_media(msg.media, file=tf.name)
+    # Album items download in parallel, each taking its own UPLOAD_SEM slot. ALBUM_SEM is held
+    # until the last batch is posted, so at most MAX_CONCURRENT_ALBUMS albums sit in memory.
+    async with ALBUM_SEM:
+        got = await asyncio.gather(*[_download_album_image(m, n) for n, m in enumerate(images, 1)],
+                                   return_exceptions=True)
+        for m, f in zip(images, got):
+            if isinstance(f, BaseException):
+                logger.warning("Album image download failed | channel='%s' msg_id=%s: %r", title, m.id, f)
+        files = [f for f in got if f and not isinstance(f, BaseException)]
+        skipped = len(got) - len(files)
+        if skipped:
+            logger.warning("SKIP %d ALBUM IMAGE(S) (too large or failed) | channel='%s'", skipped, title)
+            message += f"\n({skipped} attachment(s) could not be uploaded)"
+        if not files:
+            await submit_post("text", message, lost=[("ALBUM TEXT", title, link)]); return
+        # Discord takes at most 10 attachments per message; keep each request under the size cap too.
+        batches, cur, cur_size = [], [], 0
+        for f in files:
+            n = f[1].nbytes
+            if cur and (len(cur) == 10 or cur_size + n > MAX_UPLOAD_BYTES):
+                batches.append(cur); cur, cur_size = [], 0
+            cur.append(f); cur_size += n
+        batches.append(cur)
+        logger.info("ALBUM → Discord | channel='%s' | images=%d | link='%s'", title, len(files), link or "-")
+        for i, batch in enumerate(batches):
+            await submit_post("files", batch, content=message if i == 0 else None,
+                              lost=[(f"ALBUM PART {i + 1}/{len(batches)} ({len(batch)} images)", title, link)])
+
+async def forward_message(event):
+    msg = event.message
+    raw_text = msg.message
+    raw_text = raw_text.strip() if raw_text else ""
+    kind = image_kind(msg)
+    if not kind and not raw_text:
+        return  # nothing we forward (e.g. caption-less video/sticker): skip the lookup and formatting
+
+    title, username, header = await chat_info(event)
+    link = build_link(username, msg.id)
+    message = build_message(header, raw_text, link)
+    if kind:
+        await _forward_image(msg, kind[0], kind[1], title, message, link)
+        return
+
+    logger.info("TEXT → Discord | channel='%s' | link='%s'", title, link or "-")
+    await queue_text_to_discord(message, title, link)
+
+# One queue + worker per chat: a slow image in one channel never stalls another,
+# while messages within a channel are still forwarded in order.
+CHAT_QUEUE_SIZE = 256  # per chat; past this the chat is hopelessly behind and updates are dropped
+_chat_queues: Dict[int, asyncio.Queue] = {}
+_chat_workers: Dict[int, asyncio.Task] = {}
+
+async def chat_worker(q: asyncio.Queue):
+    pending = None  # event read past the end of an album, handled next
+    while True:
+        event, pending = pending or await q.get(), None
         try:
-            if os.path.getsize(path) <= MAX_UPLOAD_BYTES:
-                logger.info("IMAGE → Discord | channel='%s' | link='%s'", title, link or "-")
-                post_file_to_discord(path, content=message)
+            if event.message.grouped_id and ALBUM_WINDOW > 0:
+                parts, pending = await collect_album(q, event)
+                await forward_album(sorted(parts, key=lambda e: e.message.id))
             else:
-                logger.warning("SKIP IMAGE (too large) | channel='%s'", title)
-                post_text_to_discord(message + "\n(Attachment too large to upload)")
-        finally:
-            try: os.remove(path)
-            except Exception: pass
-        return
+                await forward_message(event)
+        except Exception:
+            logger.exception("Forward failed | chat_id=%s msg_id=%s", event.chat_id, event.message.id)
 
-    if raw_text:
-        logger.info("TEXT → Discord | channel='%s' | link='%s'", title, link or "-")
-        post_text_to_discord(message)
+# Telethon may replay recent updates after a reconnect; remember what was already queued.
+SEEN_MAX = 1024
+_seen: "OrderedDict[Tuple[int, int], None]" = OrderedDict()
+
+async def on_new_message(event):
+    key = (event.chat_id, event.message.id)
+    if key in _seen:
+        _seen.move_to_end(key)
+        return
+    _seen[key] = None
+    if len(_seen) > SEEN_MAX: _seen.popitem(last=False)
+    q = _chat_queues.get(event.chat_id)
+    if q is None:
+        q = _chat_queues[event.chat_id] = asyncio.Queue(maxsize=CHAT_QUEUE_SIZE)
+        _chat_workers[event.chat_id] = asyncio.create_task(chat_worker(q))
+    # Never await here: parked putters wake in arbitrary order and would reorder the chat.
+    try:
+        q.put_nowait(event)
+    except asyncio.QueueFull:
+        logger.warning("DROP (chat queue full) | chat_id=%s msg_id=%s", event.chat_id, event.message.id)
 
 # ===== Entrypoint =====
-async def main():
+async def report_startup_error(err: str):
+    logger.error(err)
+    if not await post_text_to_discord(err): logger.error("Startup error was not delivered to Discord")
+
+async def _run():
     logger.info("Starting… API_ID=%s HASH_len=%s Targets=%s Proxy=%s Conn=%s",
                 API_ID, len(API_HASH), TARGETS, bool(proxy_for_client), TG_CONN)
     headless = FORCE_HEADLESS or not sys.stdin.isatty()
@@ -259,14 +591,14 @@ async def main():
                 raise RuntimeError("session not authorized and no TTY to prompt")
         except asyncio.TimeoutError:
             err = "Startup error: connect() timed out (network blocked/blackholed?)."
-            logger.error(err); post_text_to_discord(err)
+            await report_startup_error(err)
             try:
                 if client.is_connected(): await client.disconnect()
             except Exception: pass
             return
         except Exception as e:
             err = f"Startup error (headless): {e}"
-            logger.error(err); post_text_to_discord(err)
+            await report_startup_error(err)
             try:
                 if client.is_connected(): await client.disconnect()
             except Exception: pass
@@ -280,30 +612,72 @@ async def main():
         except asyncio.TimeoutError:
             err = ("Startup error: start() timed out. Network slow or blocked. "
                    "Increase START_TIMEOUT or set SOCKS/HTTP proxy or TG_CONN=full/obfuscated.")
-            logger.error(err); post_text_to_discord(err)
+            await report_startup_error(err)
             try:
                 if client.is_connected(): await client.disconnect()
             except Exception: pass
             return
         except Exception as e:
             err = f"Startup error: interactive start() failed: {e}"
-            logger.error(err); post_text_to_discord(err)
+            await report_startup_error(err)
             try:
                 if client.is_connected(): await client.disconnect()
             except Exception: pass
             return
 
-    try:
-        displays = await asyncio.gather(*[_display_name_for_target(client, t) for t in TARGETS])
-    except Exception:
-        displays = [str(t) for t in TARGETS]
+    # Register the handler against numeric peer ids so Telethon never re-resolves @names.
+    entities = await _resolve_targets(client, TARGETS)
+    chats = []
+    for t, ent in zip(TARGETS, entities):
+        if isinstance(ent, Exception):
+            logger.warning("Could not pre-resolve %s: %s", t, ent); chats.append(t)
+        else:
+            chats.append(_remember_entity(ent))
+    # "@name" and its numeric id may both be configured; they resolve to the same peer.
+    client.add_event_handler(on_new_message, events.NewMessage(chats=list(dict.fromkeys(chats))))
+
+    displays = [_display_name_for_target(t, ent) for t, ent in zip(TARGETS, entities)]
     announce = "Started listening to channels: " + ", ".join(displays)
-    logger.info(announce); post_text_to_discord(announce)
+    # The announcement goes out in the background; listening doesn't wait on the webhook round-trip.
+    logger.info(announce); announce_task = asyncio.create_task(post_text_to_discord(announce))
+    announce_task.add_done_callback(
+        lambda t: t.cancelled() or t.result() or logger.warning("Start announcement was not delivered to Discord"))
 
     logger.info("Running. Listening to channels:")
     for t in displays: logger.info(" - %s", t)
 
-    await client.run_until_disconnected()
+    try:
+        await client.run_until_disconnected()
+    finally:
+        if not announce_task.done(): announce_task.cancel()
+
+async def main():
+    global SESSION, LIMITER, DISCORD_QUEUE, UPLOAD_SEM, ALBUM_SEM
+    LIMITER = AsyncRateLimiter(DISCORD_RATE, DISCORD_RATE_WINDOW)
+    UPLOAD_SEM = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+    ALBUM_SEM = asyncio.Semaphore(MAX_CONCURRENT_ALBUMS)
+    # One pooled keep-alive connection set to discord.com: no TLS handshake per post.
+    # A handful of warm connections covers the webhook's 5 req/2s budget.
+    SESSION = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=16, limit_per_host=4, keepalive_timeout=75),
+        timeout=TEXT_TIMEOUT,
+        headers={"User-Agent": "tg-forwarder/1.0"},
+    )
+    DISCORD_QUEUE = asyncio.Queue()  # unbounded: enqueue_post must never block or reorder
+    sender = asyncio.create_task(discord_worker())
+    try:
+        await _run()
+    finally:
+        for t in _chat_workers.values(): t.cancel()
+        left = sum(q.qsize() for q in _chat_queues.values())
+        if left: logger.warning("DROP %d queued update(s) on shutdown", left)
+        await drain_discord_queue(sender)
+        await SESSION.close()
 
 if __name__ == "__main__":
+    try:
+        import uvloop  # optional: libuv-based loop, cheaper socket I/O for Telethon and aiohttp
+        uvloop.install()
+    except ImportError:
+        pass
     asyncio.run(main())